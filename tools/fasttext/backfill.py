@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+backfill.py
+
+Re-classify historical rows of the app SQLite DB with a newly trained model and
+write the predicted label back, e.g. `transactions.category` from `description`
+or `messages.intent` from `text` (the same tables train_fasttext.py reads).
+
+Usage:
+  python tools/fasttext/backfill.py --db /path/to/catatan_keuangan.db --target transactions --model ./models/fasttext_model.bin --label-map category_map.json
+  python tools/fasttext/backfill.py --db /path/to/catatan_keuangan.db --target messages --rules tools/fasttext/models/rules.model --add-column --only-missing --resume
+
+How it works:
+ - rows are streamed in keyset-paginated chunks (`WHERE id > :last ORDER BY id LIMIT n`),
+   so every chunk is an index range scan no matter how deep into the table we are
+ - each chunk is split across a pool of worker processes, each holding its own
+   copy of the model and predicting its slice in one batched call
+ - results are written back with one executemany per chunk inside a single
+   transaction, with the DB in WAL mode so the app can keep reading meanwhile
+ - the last committed key is persisted to a state file; --resume continues from it
+
+The label column must exist; the app schema has no messages.intent, so pass
+--add-column to create it (as TEXT) once. --dry-run never changes the DB.
+
+--label-map is an optional JSON object mapping model labels to stored values
+(e.g. {"makanan": "Eating Out"}); labels missing from the map are stored as-is.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from multiprocessing import Pool
+
+from export_keywords import RulesModel
+from profiling import add_profile_args, profile_stage, start_profiling
+
+try:
+    import fasttext
+except Exception:
+    fasttext = None
+
+LABEL_PREFIX = "__label__"
+
+# target -> (key column, text column, label column)
+TARGETS = {
+    "transactions": ("id", "description", "category"),
+    "messages": ("id", "text", "intent"),
+    "parsed_messages": ("id", "raw_text", "intent"),
+}
+
+_classifier = None
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def load_classifier(model_path, rules_path):
+    global _classifier
+    if model_path:
+        _classifier = ('fasttext', fasttext.load_model(model_path))
+    else:
+        _classifier = ('rules', RulesModel(rules_path))
+
+
+def predict_batch(texts):
+    """Return (label, probability) for every text using the process-local classifier."""
+    kind, model = _classifier
+    texts = [t.replace('\n', ' ') for t in texts]
+    if kind == 'fasttext':
+        labels, probs = model.predict(texts, k=1)
+        return [(ls[0][len(LABEL_PREFIX):], float(ps[0])) if len(ls) else (None, 0.0)
+                for ls, ps in zip(labels, probs)]
+    out = []
+    for t in texts:
+        preds = model.predict(t, k=1)
+        out.append((preds[0][0], 1.0) if preds else (None, 0.0))
+    return out
+
+
+def ensure_label_column(conn, table, label_col, add_missing=False):
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({quote_ident(table)})")]
+    if not cols:
+        raise sqlite3.OperationalError(f"no such table: {table}")
+    if label_col not in cols:
+        if not add_missing:
+            raise sqlite3.OperationalError(f"no such column: {table}.{label_col} (pass --add-column to create it)")
+        print(f"Adding missing column {table}.{label_col}", file=sys.stderr)
+        conn.execute(f"ALTER TABLE {quote_ident(table)} ADD COLUMN {quote_ident(label_col)} TEXT")
+        conn.commit()
+
+
+def iter_chunks(conn, table, key_col, text_col, label_col, chunk_size, last_key, only_missing):
+    where = [f"{quote_ident(text_col)} IS NOT NULL"]
+    if only_missing:
+        where.append(f"({quote_ident(label_col)} IS NULL OR {quote_ident(label_col)} = '')")
+    select = f"SELECT {quote_ident(key_col)}, {quote_ident(text_col)} FROM {quote_ident(table)}"
+    order = f"ORDER BY {quote_ident(key_col)} LIMIT ?"
+    while True:
+        if last_key is None:
+            sql, params = f"{select} WHERE {' AND '.join(where)} {order}", (chunk_size,)
+        else:
+            keyset = [f"{quote_ident(key_col)} > ?"] + where
+            sql, params = f"{select} WHERE {' AND '.join(keyset)} {order}", (last_key, chunk_size)
+        with profile_stage('db_read'):
+            rows = conn.execute(sql, params).fetchall()
+        if not rows:
+            return
+        last_key = rows[-1][0]
+        yield rows
+
+
+def split_evenly(items, n):
+    size = max(1, -(-len(items) // n))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def save_state(state_path, state):
+    tmp = state_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as sf:
+        json.dump(state, sf)
+    os.replace(tmp, state_path)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--db', required=True, help='Path to the app SQLite DB')
+    p.add_argument('--target', choices=sorted(TARGETS), default='transactions')
+    p.add_argument('--table', help='override table name of --target')
+    p.add_argument('--text-col', help='override text column of --target')
+    p.add_argument('--label-col', help='override label column of --target')
+    p.add_argument('--model', help='fastText model (.bin)')
+    p.add_argument('--rules', help='rules.model keyword file (used when --model is not given)')
+    p.add_argument('--label-map', help='JSON file mapping model labels to stored values')
+    p.add_argument('--min-prob', type=float, default=0.0, help='leave rows unchanged below this probability')
+    p.add_argument('--only-missing', action='store_true', help='only rows whose label column is NULL or empty')
+    p.add_argument('--chunk-size', type=int, default=20000, help='rows per read chunk and per write transaction')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    p.add_argument('--dry-run', action='store_true', help='classify and report but do not write')
+    p.add_argument('--add-column', action='store_true', help='create the label column if the table lacks it')
+    p.add_argument('--resume', action='store_true', help='continue after the last committed key (uses state file)')
+    p.add_argument('--state-file', default=None, help='defaults to <db>.backfill.<table>.state.json')
+    add_profile_args(p)
+    args = p.parse_args()
+    start_profiling(args, 'backfill')
+
+    if not args.model and not args.rules:
+        print("Provide --model or --rules", file=sys.stderr)
+        sys.exit(1)
+    if args.model and fasttext is None:
+        print("fasttext python package not installed. Install with: pip install fasttext", file=sys.stderr)
+        sys.exit(2)
+
+    key_col, text_col, label_col = TARGETS[args.target]
+    table = args.table or args.target
+    text_col = args.text_col or text_col
+    label_col = args.label_col or label_col
+    label_map = {}
+    if args.label_map:
+        with open(args.label_map, 'r', encoding='utf-8') as f:
+            label_map = json.load(f)
+
+    state_path = args.state_file if args.state_file else f"{args.db}.backfill.{table}.state.json"
+    state = {}
+    if args.resume and os.path.exists(state_path):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as sf:
+                state = json.load(sf)
+        except Exception:
+            state = {}
+    last_key = state.get('last_key')
+    if last_key is not None:
+        print(f"Resuming {table} after key {last_key!r} ({state.get('rows', 0)} rows done)", file=sys.stderr)
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        if not args.dry_run:
+            # WAL lets the app keep reading while we hold the write lock for a chunk
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            ensure_label_column(conn, table, label_col, add_missing=args.add_column)
+        elif args.only_missing:
+            # --only-missing filters on the label column, so it has to exist even for a dry run
+            ensure_label_column(conn, table, label_col)
+    except sqlite3.OperationalError as e:
+        print("DB setup failed:", e, file=sys.stderr)
+        sys.exit(3)
+
+    update_sql = f"UPDATE {quote_ident(table)} SET {quote_ident(label_col)} = ? WHERE {quote_ident(key_col)} = ?"
+    pool = None
+    if args.workers > 1:
+        pool = Pool(args.workers, initializer=load_classifier, initargs=(args.model, args.rules))
+    else:
+        load_classifier(args.model, args.rules)
+
+    done = state.get('rows', 0)
+    updated = state.get('updated', 0)
+    started = time.perf_counter()
+    run_rows = 0
+    try:
+        for rows in iter_chunks(conn, table, key_col, text_col, label_col, args.chunk_size, last_key, args.only_missing):
+            t0 = time.perf_counter()
+            texts = [r[1] for r in rows]
+            with profile_stage('predict'):
+                if pool:
+                    preds = [x for part in pool.map(predict_batch, split_evenly(texts, args.workers)) for x in part]
+                else:
+                    preds = predict_batch(texts)
+            updates = [(label_map.get(label, label), key) for (key, _text), (label, prob) in zip(rows, preds)
+                       if label and prob >= args.min_prob]
+            if not args.dry_run:
+                with profile_stage('db_write'), conn:
+                    conn.executemany(update_sql, updates)
+            last_key = rows[-1][0]
+            done += len(rows)
+            updated += len(updates)
+            run_rows += len(rows)
+            if not args.dry_run:
+                save_state(state_path, {'last_key': last_key, 'rows': done, 'updated': updated,
+                                        'model': args.model or args.rules})
+            elapsed = time.perf_counter() - t0
+            total_elapsed = time.perf_counter() - started
+            print(f"{done} rows ({updated} updated) | chunk {len(rows) / elapsed:.0f} rows/s | "
+                  f"overall {run_rows / total_elapsed:.0f} rows/s", file=sys.stderr)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        conn.close()
+
+    total_elapsed = time.perf_counter() - started
+    rate = run_rows / total_elapsed if total_elapsed else 0.0
+    verb = 'would update' if args.dry_run else 'updated'
+    print(f"Backfill of {table}.{label_col} finished: {run_rows} rows classified, {verb} {updated}, {rate:.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
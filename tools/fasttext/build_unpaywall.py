@@ -28,6 +28,9 @@ import requests
 from bs4 import BeautifulSoup
 from pdfminer.high_level import extract_text as extract_pdf_text
 
+from profiling import add_profile_args, profile_stage, profiled, start_profiling
+from work_queue import DEFAULT_LEASE_SECONDS, WorkQueue, default_worker_id, shard_path
+
 CROSSREF_API = "https://api.crossref.org/works"
 UNPAYWALL_API = "https://api.unpaywall.org/v2/{doi}"
 HEADERS = {"User-Agent": "ckp_temp-unpaywall/1.0 (+https://example.local)"}
@@ -51,6 +54,7 @@ def normalize_text(s: str) -> str:
     return re.sub(r"\s+", " ", s).strip()
 
 
+@profiled('parse')
 def extract_text_from_html(html: str) -> str:
     soup = BeautifulSoup(html, "lxml")
     for tag in soup(["script", "style", "noscript", "iframe"]):
@@ -74,6 +78,7 @@ def find_label_for_sentence(s: str):
     return None
 
 
+@profiled('fetch')
 def query_crossref(query: str, rows: int = 20, offset: int = 0):
     params = {"query": query, "rows": rows, "offset": offset}
     r = requests.get(CROSSREF_API, params=params, headers=HEADERS, timeout=15)
@@ -83,6 +88,7 @@ def query_crossref(query: str, rows: int = 20, offset: int = 0):
     return items
 
 
+@profiled('fetch')
 def query_unpaywall(doi: str, email: str) -> Optional[dict]:
     url = UNPAYWALL_API.format(doi=doi)
     params = {"email": email}
@@ -92,6 +98,7 @@ def query_unpaywall(doi: str, email: str) -> Optional[dict]:
     return None
 
 
+@profiled('fetch')
 def download_url(url: str, timeout=30) -> Optional[bytes]:
     try:
         r = requests.get(url, headers=HEADERS, timeout=timeout)
@@ -102,6 +109,7 @@ def download_url(url: str, timeout=30) -> Optional[bytes]:
     return None
 
 
+@profiled('pdf_extract')
 def extract_text_from_pdf_bytes(b: bytes, tmp_path: str) -> Optional[str]:
     try:
         with open(tmp_path, "wb") as f:
@@ -112,6 +120,174 @@ def extract_text_from_pdf_bytes(b: bytes, tmp_path: str) -> Optional[str]:
         return None
 
 
+def process_query(q, state, out, args, state_path, tmp_pdf, queue=None, worker_id=None):
+    """Harvest labeled sentences for one CrossRef query into `out`, updating `state[q]`. Returns lines written.
+
+    With a shared `queue`, DOIs already harvested by any worker are skipped, and a DOI
+    is recorded there only once its lines are flushed, so a takeover after a worker
+    died does not download them again.
+    """
+    def claim_doi(doi):
+        # flush first: a DOI must never be recorded as done before its lines are on disk
+        out.flush()
+        if queue is not None:
+            queue.mark_seen(doi, worker_id)
+
+    total_written = 0
+    print(f"Searching CrossRef for '{q}'...", file=sys.stderr)
+    qstate = state.get(q, {})
+    offset = qstate.get('offset', 0)
+    seen_dois = set(qstate.get('seen_dois', []))
+    written_for_q = qstate.get('written', 0)
+    # if we've already reached the per-query target, skip
+    if written_for_q >= args.max_per_query:
+        print(f"Skipping '{q}', already have {written_for_q} lines (target {args.max_per_query}).", file=sys.stderr)
+        return 0
+    while written_for_q < args.max_per_query and offset < 1000:
+        # Query CrossRef with simple retry/backoff to avoid crashing on transient network errors
+        items = []
+        max_retries = 3
+        attempt = 0
+        while attempt < max_retries:
+            try:
+                items = query_crossref(q, rows=args.crossref_rows, offset=offset)
+                break
+            except Exception as e:
+                attempt += 1
+                print(f"CrossRef query failed (attempt {attempt}/{max_retries}): {e}", file=sys.stderr)
+                # persist state so we can resume safely
+                try:
+                    state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
+                    with open(state_path, 'w', encoding='utf-8') as sf:
+                        json.dump(state, sf)
+                except Exception:
+                    pass
+                if attempt >= max_retries:
+                    print(f"Giving up on query '{q}' at offset {offset} after {attempt} attempts.", file=sys.stderr)
+                    items = []
+                    break
+                time.sleep(5 * attempt)
+        if not items:
+            break
+        for it in items:
+            doi = it.get("DOI")
+            if not doi or doi in seen_dois:
+                continue
+            seen_dois.add(doi)
+            if queue is not None and queue.is_seen(doi):
+                continue
+            # Prefer CrossRef abstract if available
+            cr_abstract = it.get("abstract")
+            if cr_abstract:
+                # CrossRef returns HTML-ish abstract; strip tags
+                t = re.sub(r'<.*?>', ' ', cr_abstract)
+                t = normalize_text(t)
+                with profile_stage('split_label'):
+                    sents = split_sentences(t)
+                    for s in sents:
+                        label = find_label_for_sentence(s)
+                        if label:
+                            out.write(f"__label__{label} {s}\n")
+                            total_written += 1
+                            written_for_q += 1
+                            # persist state
+                            try:
+                                state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
+                                with open(state_path, 'w', encoding='utf-8') as sf:
+                                    json.dump(state, sf)
+                            except Exception:
+                                pass
+                            if written_for_q >= args.max_per_query:
+                                break
+                if written_for_q >= args.max_per_query:
+                    claim_doi(doi)
+                    break
+            # Query Unpaywall to find OA copy
+            try:
+                up = query_unpaywall(doi, args.email)
+            except Exception:
+                up = None
+            if up and up.get("is_oa"):
+                locations = up.get("oa_locations") or []
+                # prefer pdf
+                pdf_url = None
+                html_url = None
+                for loc in locations:
+                    url = loc.get("url")
+                    if not url:
+                        continue
+                    if loc.get("url_for_landing_page") and not pdf_url:
+                        html_url = loc.get("url_for_landing_page")
+                    if loc.get("url_for_pdf"):
+                        pdf_url = loc.get("url_for_pdf")
+                        break
+                content = None
+                if pdf_url:
+                    print(f"Downloading PDF {pdf_url}", file=sys.stderr)
+                    b = download_url(pdf_url)
+                    if b:
+                        text = extract_text_from_pdf_bytes(b, tmp_pdf)
+                        if text:
+                            with profile_stage('split_label'):
+                                sents = split_sentences(text)
+                                for s in sents:
+                                    label = find_label_for_sentence(s)
+                                    if label:
+                                        out.write(f"__label__{label} {s}\n")
+                                        total_written += 1
+                                        written_for_q += 1
+                                        try:
+                                            state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
+                                            with open(state_path, 'w', encoding='utf-8') as sf:
+                                                json.dump(state, sf)
+                                        except Exception:
+                                            pass
+                                        if written_for_q >= args.max_per_query:
+                                            break
+                elif html_url:
+                    print(f"Downloading HTML {html_url}", file=sys.stderr)
+                    b = download_url(html_url)
+                    if b:
+                        try:
+                            txt = extract_text_from_html(b.decode('utf-8', errors='ignore'))
+                            with profile_stage('split_label'):
+                                sents = split_sentences(txt)
+                                for s in sents:
+                                    label = find_label_for_sentence(s)
+                                    if label:
+                                        out.write(f"__label__{label} {s}\n")
+                                        total_written += 1
+                                        written_for_q += 1
+                                        try:
+                                            state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
+                                            with open(state_path, 'w', encoding='utf-8') as sf:
+                                                json.dump(state, sf)
+                                        except Exception:
+                                            pass
+                                        if written_for_q >= args.max_per_query:
+                                            break
+                        except Exception:
+                            pass
+            claim_doi(doi)
+            # polite pause
+            time.sleep(1.0)
+            if written_for_q >= args.max_per_query:
+                break
+        offset += args.crossref_rows
+        # break early if we've written enough for this query
+        if written_for_q >= args.max_per_query:
+            break
+    print(f"Wrote {total_written} lines for query '{q}' so far.", file=sys.stderr)
+    # persist per-query final state
+    try:
+        state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
+        with open(state_path, 'w', encoding='utf-8') as sf:
+            json.dump(state, sf)
+    except Exception:
+        pass
+    return total_written
+
+
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--queries", required=True, help="Comma-separated queries (quoted)")
@@ -121,12 +297,19 @@ def main():
     p.add_argument("--crossref-rows", type=int, default=50)
     p.add_argument('--resume', action='store_true', help='resume previous run using state file')
     p.add_argument('--state-file', default=None, help='path to state file (defaults to <out>.state.json)')
+    p.add_argument('--queue', default=None, help='worker mode: lease queries from this shared SQLite queue and write <out>.shard-<worker-id>')
+    p.add_argument('--worker-id', default=None, help='worker name in queue mode (defaults to <hostname>-<pid>)')
+    p.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS, help="queue lease length; a dead worker's query is requeued after this")
+    add_profile_args(p)
     args = p.parse_args()
+    start_profiling(args, 'build_unpaywall')
 
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
     queries = [q.strip() for q in args.queries.split(",") if q.strip()]
     total_written = 0
-    state_path = args.state_file if args.state_file else args.out + '.state.json'
+    worker_id = args.worker_id or default_worker_id()
+    out_path = shard_path(args.out, worker_id) if args.queue else args.out
+    state_path = args.state_file if args.state_file else out_path + '.state.json'
     state = {}
     if args.resume and os.path.exists(state_path):
         try:
@@ -134,158 +317,28 @@ def main():
                 state = json.load(sf)
         except Exception:
             state = {}
-    tmp_pdf = os.path.join("/tmp", "ckp_temp_unpaywall_tmp.pdf")
-
-    # open out file in append mode when resuming, otherwise overwrite
-    out_mode = 'a' if args.resume else 'w'
-    with open(args.out, out_mode, encoding='utf-8') as out:
-        for q in queries:
-            print(f"Searching CrossRef for '{q}'...", file=sys.stderr)
-            qstate = state.get(q, {})
-            offset = qstate.get('offset', 0)
-            seen_dois = set(qstate.get('seen_dois', []))
-            written_for_q = qstate.get('written', 0)
-            # if we've already reached the per-query target, skip
-            if written_for_q >= args.max_per_query:
-                print(f"Skipping '{q}', already have {written_for_q} lines (target {args.max_per_query}).", file=sys.stderr)
-                continue
-            while written_for_q < args.max_per_query and offset < 1000:
-                # Query CrossRef with simple retry/backoff to avoid crashing on transient network errors
-                items = []
-                max_retries = 3
-                attempt = 0
-                while attempt < max_retries:
-                    try:
-                        items = query_crossref(q, rows=args.crossref_rows, offset=offset)
-                        break
-                    except Exception as e:
-                        attempt += 1
-                        print(f"CrossRef query failed (attempt {attempt}/{max_retries}): {e}", file=sys.stderr)
-                        # persist state so we can resume safely
-                        try:
-                            state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
-                            with open(state_path, 'w', encoding='utf-8') as sf:
-                                json.dump(state, sf)
-                        except Exception:
-                            pass
-                        if attempt >= max_retries:
-                            print(f"Giving up on query '{q}' at offset {offset} after {attempt} attempts.", file=sys.stderr)
-                            items = []
-                            break
-                        time.sleep(5 * attempt)
-                if not items:
-                    break
-                for it in items:
-                    doi = it.get("DOI")
-                    if not doi or doi in seen_dois:
-                        continue
-                    seen_dois.add(doi)
-                    # Prefer CrossRef abstract if available
-                    cr_abstract = it.get("abstract")
-                    if cr_abstract:
-                        # CrossRef returns HTML-ish abstract; strip tags
-                        t = re.sub(r'<.*?>', ' ', cr_abstract)
-                        t = normalize_text(t)
-                        sents = split_sentences(t)
-                        for s in sents:
-                            label = find_label_for_sentence(s)
-                            if label:
-                                out.write(f"__label__{label} {s}\n")
-                                total_written += 1
-                                written_for_q += 1
-                                # persist state
-                                try:
-                                    state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
-                                    with open(state_path, 'w', encoding='utf-8') as sf:
-                                        json.dump(state, sf)
-                                except Exception:
-                                    pass
-                                if written_for_q >= args.max_per_query:
-                                    break
-                        if written_for_q >= args.max_per_query:
-                            break
-                    # Query Unpaywall to find OA copy
-                    try:
-                        up = query_unpaywall(doi, args.email)
-                    except Exception:
-                        up = None
-                    if up and up.get("is_oa"):
-                        locations = up.get("oa_locations") or []
-                        # prefer pdf
-                        pdf_url = None
-                        html_url = None
-                        for loc in locations:
-                            url = loc.get("url")
-                            if not url:
-                                continue
-                            if loc.get("url_for_landing_page") and not pdf_url:
-                                html_url = loc.get("url_for_landing_page")
-                            if loc.get("url_for_pdf"):
-                                pdf_url = loc.get("url_for_pdf")
-                                break
-                        content = None
-                        if pdf_url:
-                            print(f"Downloading PDF {pdf_url}", file=sys.stderr)
-                            b = download_url(pdf_url)
-                            if b:
-                                text = extract_text_from_pdf_bytes(b, tmp_pdf)
-                                if text:
-                                    sents = split_sentences(text)
-                                    for s in sents:
-                                        label = find_label_for_sentence(s)
-                                        if label:
-                                            out.write(f"__label__{label} {s}\n")
-                                            total_written += 1
-                                            written_for_q += 1
-                                            try:
-                                                state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
-                                                with open(state_path, 'w', encoding='utf-8') as sf:
-                                                    json.dump(state, sf)
-                                            except Exception:
-                                                pass
-                                            if written_for_q >= args.max_per_query:
-                                                break
-                        elif html_url:
-                            print(f"Downloading HTML {html_url}", file=sys.stderr)
-                            b = download_url(html_url)
-                            if b:
-                                try:
-                                    txt = extract_text_from_html(b.decode('utf-8', errors='ignore'))
-                                    sents = split_sentences(txt)
-                                    for s in sents:
-                                        label = find_label_for_sentence(s)
-                                        if label:
-                                            out.write(f"__label__{label} {s}\n")
-                                            total_written += 1
-                                            written_for_q += 1
-                                            try:
-                                                state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
-                                                with open(state_path, 'w', encoding='utf-8') as sf:
-                                                    json.dump(state, sf)
-                                            except Exception:
-                                                pass
-                                            if written_for_q >= args.max_per_query:
-                                                break
-                                except Exception:
-                                    pass
-                    # polite pause
-                    time.sleep(1.0)
-                    if written_for_q >= args.max_per_query:
-                        break
-                offset += args.crossref_rows
-                # break early if we've written enough for this query
-                if written_for_q >= args.max_per_query:
-                    break
-            print(f"Wrote {total_written} lines for query '{q}' so far.", file=sys.stderr)
-            total_written = 0  # reset counter per query
-            # persist per-query final state
-            try:
-                state[q] = {'seen_dois': list(seen_dois), 'written': written_for_q, 'offset': offset}
-                with open(state_path, 'w', encoding='utf-8') as sf:
-                    json.dump(state, sf)
-            except Exception:
-                pass
-    print(f"Finished. Output -> {args.out}")
+    # per-process temp file so several workers on one machine don't overwrite each other's PDF
+    tmp_pdf = os.path.join("/tmp", f"ckp_temp_unpaywall_tmp.{os.getpid()}.pdf")
+
+    # open out file in append mode when resuming (or as a worker), otherwise overwrite
+    out_mode = 'a' if (args.resume or args.queue) else 'w'
+    with open(out_path, out_mode, encoding='utf-8') as out:
+        if args.queue:
+            queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+            added = queue.add('query', queries)
+            print(f"[{worker_id}] queue {args.queue}: {added} new queries added", file=sys.stderr)
+
+            def handle(q):
+                nonlocal total_written
+                total_written += process_query(q, state, out, args, state_path, tmp_pdf,
+                                               queue=queue, worker_id=worker_id)
+                out.flush()
+
+            queue.run('query', worker_id, handle)
+        else:
+            for q in queries:
+                total_written += process_query(q, state, out, args, state_path, tmp_pdf)
+    print(f"Finished. Wrote {total_written} lines. Output -> {out_path}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+evaluate.py
+
+Evaluate the fastText model and the `rules.model` keyword fallback on a held-out
+fastText-format file (e.g. valid.txt / test.txt from prep_corpus.py) and write a
+JSON report with quality and cost numbers for each classifier:
+
+ - accuracy, macro F1, per-label precision/recall/F1/support, confusion matrix
+ - load time, model file size and RSS growth after load
+ - p50/p95/p99 single-message latency and batch throughput
+
+Usage:
+  python tools/fasttext/evaluate.py --data data/prepared/test.txt --model models/fasttext_model.bin --rules tools/fasttext/models/rules.model --out reports/eval.json
+  python tools/fasttext/evaluate.py --data test.txt --model new/fasttext_model.bin --compare reports/eval.json
+
+The report is written with sorted keys so two runs can be compared with a plain
+`diff`; --compare prints the headline metric deltas against an older report.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from collections import Counter, defaultdict
+
+from export_keywords import RulesModel
+from profiling import add_profile_args, profile_stage, start_profiling
+
+try:
+    import fasttext
+except Exception:
+    fasttext = None
+
+LABEL_PREFIX = "__label__"
+NO_PREDICTION = "__none__"
+
+
+def rss_mb():
+    """Current resident set size in MB (falls back to peak RSS where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+
+def parse_line(line: str):
+    line = line.strip()
+    if not line.startswith(LABEL_PREFIX) or ' ' not in line:
+        return None
+    labels = []
+    rest = line
+    while rest.startswith(LABEL_PREFIX) and ' ' in rest:
+        head, rest = rest.split(' ', 1)
+        labels.append(head[len(LABEL_PREFIX):])
+    # score against the first label, same as prep_corpus.py stratifies
+    return labels[0], rest
+
+
+def iter_batches(path, batch_size):
+    batch = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class FastTextClassifier:
+    name = 'fasttext'
+
+    def __init__(self, path):
+        self.path = path
+        self.model = fasttext.load_model(path)
+
+    def predict_one(self, text):
+        labels, _probs = self.model.predict(text, k=1)
+        return labels[0][len(LABEL_PREFIX):] if labels else NO_PREDICTION
+
+    def predict_batch(self, texts):
+        labels, _probs = self.model.predict(texts, k=1)
+        return [ls[0][len(LABEL_PREFIX):] if ls else NO_PREDICTION for ls in labels]
+
+
+class RulesClassifier:
+    name = 'rules'
+
+    def __init__(self, path):
+        self.path = path
+        self.model = RulesModel(path)
+
+    def predict_one(self, text):
+        preds = self.model.predict(text, k=1)
+        return preds[0][0] if preds else NO_PREDICTION
+
+    def predict_batch(self, texts):
+        return [self.predict_one(t) for t in texts]
+
+
+def quality_metrics(confusion):
+    labels = sorted(set(confusion) | {p for row in confusion.values() for p in row})
+    per_label = {}
+    total = correct = 0
+    for label in labels:
+        tp = confusion.get(label, {}).get(label, 0)
+        support = sum(confusion.get(label, {}).values())
+        predicted = sum(row.get(label, 0) for row in confusion.values())
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        total += support
+        correct += tp
+        if support or label != NO_PREDICTION:
+            per_label[label] = {'precision': round(precision, 4), 'recall': round(recall, 4),
+                                'f1': round(f1, 4), 'support': support}
+    gold = [label for label in per_label if per_label[label]['support']]
+    macro_f1 = sum(per_label[label]['f1'] for label in gold) / len(gold) if gold else 0.0
+    return {
+        'examples': total,
+        'accuracy': round(correct / total, 4) if total else 0.0,
+        'macro_f1': round(macro_f1, 4),
+        'per_label': per_label,
+        'confusion': {gold_label: dict(sorted(row.items())) for gold_label, row in sorted(confusion.items())},
+    }
+
+
+def evaluate(make_classifier, path, data_path, batch_size, latency_samples):
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    with profile_stage('load'):
+        clf = make_classifier(path)
+    load_seconds = time.perf_counter() - t0
+    rss_after_load = rss_mb()
+
+    confusion = defaultdict(Counter)
+    samples = []
+    predict_seconds = 0.0
+    n = 0
+    for batch in iter_batches(data_path, batch_size):
+        texts = [text for _gold, text in batch]
+        t0 = time.perf_counter()
+        with profile_stage('predict'):
+            preds = clf.predict_batch(texts)
+        predict_seconds += time.perf_counter() - t0
+        n += len(batch)
+        for (gold, _text), pred in zip(batch, preds):
+            confusion[gold][pred] += 1
+        if len(samples) < latency_samples:
+            samples.extend(texts[:latency_samples - len(samples)])
+
+    latencies = []
+    with profile_stage('latency'):
+        for text in samples:
+            t0 = time.perf_counter()
+            clf.predict_one(text)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+    latencies.sort()
+
+    report = quality_metrics(confusion)
+    report['performance'] = {
+        'model_path': path,
+        'model_bytes': os.path.getsize(path),
+        'load_seconds': round(load_seconds, 4),
+        'rss_load_delta_mb': round(rss_after_load - rss_before, 2),
+        'batch_size': batch_size,
+        'throughput_per_sec': round(n / predict_seconds, 1) if predict_seconds else 0.0,
+        'latency_ms': {
+            'samples': len(latencies),
+            'mean': round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 4),
+            'p95': round(percentile(latencies, 95), 4),
+            'p99': round(percentile(latencies, 99), 4),
+        },
+    }
+    return report
+
+
+def print_summary(report):
+    for name, r in report['classifiers'].items():
+        perf = r['performance']
+        lat = perf['latency_ms']
+        print(f"[{name}] acc={r['accuracy']:.4f} macro_f1={r['macro_f1']:.4f} "
+              f"load={perf['load_seconds']:.3f}s p50={lat['p50']:.3f}ms p95={lat['p95']:.3f}ms "
+              f"p99={lat['p99']:.3f}ms throughput={perf['throughput_per_sec']:.0f}/s "
+              f"rss+={perf['rss_load_delta_mb']:.1f}MB")
+        for label, m in sorted(r['per_label'].items()):
+            print(f"    {label:<16} P={m['precision']:.3f} R={m['recall']:.3f} F1={m['f1']:.3f} n={m['support']}")
+
+
+def print_comparison(report, old):
+    print(f"Compared with {old.get('data', '?')}:")
+    for name, r in report['classifiers'].items():
+        prev = old.get('classifiers', {}).get(name)
+        if not prev:
+            continue
+        rows = [
+            ('accuracy', r['accuracy'], prev['accuracy']),
+            ('macro_f1', r['macro_f1'], prev['macro_f1']),
+            ('p95_ms', r['performance']['latency_ms']['p95'], prev['performance']['latency_ms']['p95']),
+            ('throughput', r['performance']['throughput_per_sec'], prev['performance']['throughput_per_sec']),
+            ('model_bytes', r['performance']['model_bytes'], prev['performance']['model_bytes']),
+        ]
+        for metric, new_v, old_v in rows:
+            print(f"  [{name}] {metric:<12} {old_v} -> {new_v} ({new_v - old_v:+.4g})")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--data', required=True, help='held-out fastText file (__label__<label> <text> per line)')
+    p.add_argument('--model', help='fastText model (.bin) to evaluate')
+    p.add_argument('--rules', help='rules.model keyword file to evaluate')
+    p.add_argument('--out', help='write the JSON report here')
+    p.add_argument('--compare', help='older JSON report to print metric deltas against')
+    p.add_argument('--batch-size', type=int, default=1024)
+    p.add_argument('--latency-samples', type=int, default=1000, help='messages timed one at a time for p50/p95/p99')
+    add_profile_args(p)
+    args = p.parse_args()
+    start_profiling(args, 'evaluate')
+
+    if not args.model and not args.rules:
+        print("Provide --model and/or --rules", file=sys.stderr)
+        sys.exit(1)
+    if args.model and fasttext is None:
+        print("fasttext python package not installed. Install with: pip install fasttext", file=sys.stderr)
+        sys.exit(2)
+
+    report = {'data': args.data, 'classifiers': {}}
+    for cls, path in ((FastTextClassifier, args.model), (RulesClassifier, args.rules)):
+        if not path:
+            continue
+        print(f"Evaluating {cls.name} ({path}) on {args.data} ...", file=sys.stderr)
+        report['classifiers'][cls.name] = evaluate(cls, path, args.data, args.batch_size, args.latency_samples)
+
+    print_summary(report)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+    if args.out:
+        if os.path.dirname(args.out):
+            os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Report written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+expand_keywords.py
+
+Propose new keywords for each label (misspellings, synonyms, regional terms)
+from the nearest neighbours of the existing seed keywords in a trained model's
+embedding space.
+
+Usage:
+  python tools/fasttext/expand_keywords.py --model ./models/fasttext_model.bin --rules tools/fasttext/models/rules.model --out expansions.json
+  python tools/fasttext/expand_keywords.py --vec wiki.id.vec --seeds label_keywords.json --topk 20 --out-rules models/rules_expanded.model
+
+Seeds come from a rules.model file (label<TAB>kw1,kw2) and/or a JSON object
+{label: [kw, ...]} in the same shape as LABEL_KEYWORDS in the builders.
+
+How it works:
+ - the model's input vectors are exported once into `<prefix>.f16.npy` (row
+   L2-normalized, float16) plus `<prefix>.vocab.txt`, and reopened memory-mapped
+   on later runs, so a large vocabulary costs neither load time nor RAM
+ - all seed vectors are stacked into one query matrix and scored against the
+   vocabulary in row chunks (--chunk-rows x n_seeds floats at a time) with a
+   running top-k per seed, so the full similarity matrix is never built
+ - per label, neighbours of all its seeds are merged (max similarity wins) and
+   words that are already seeds of any label are dropped
+
+Proposals are for review: check them before merging into LABEL_KEYWORDS or
+shipping the --out-rules file.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+from profiling import add_profile_args, profiled, start_profiling
+
+try:
+    import fasttext
+except Exception:
+    fasttext = None
+
+EXPORT_CHUNK_ROWS = 65536
+
+
+def normalize_rows(block):
+    block = np.asarray(block, dtype=np.float32)
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return block / norms
+
+
+@profiled('export')
+def export_from_model(model_path, matrix_path, vocab_path):
+    model = fasttext.load_model(model_path)
+    words = model.get_words()
+    dim = model.get_dimension()
+    out = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float16, shape=(len(words), dim))
+    # supervised models without subwords keep word i in input row i; with subwords the
+    # word vector also averages its char n-gram rows, so ask fastText for it.
+    # get_input_matrix() copies every row (nwords + bucket), so only fetch it when it is sliced.
+    has_subwords = model.maxn > 0 and model.bucket > 0
+    inputs = None if has_subwords else model.get_input_matrix()
+    for start in range(0, len(words), EXPORT_CHUNK_ROWS):
+        end = min(start + EXPORT_CHUNK_ROWS, len(words))
+        if has_subwords:
+            block = np.stack([model.get_word_vector(w) for w in words[start:end]])
+        else:
+            block = inputs[start:end]
+        out[start:end] = normalize_rows(block).astype(np.float16)
+    out.flush()
+    del out
+    write_vocab(vocab_path, words)
+    return model
+
+
+@profiled('export')
+def export_from_vec(vec_path, matrix_path, vocab_path):
+    with open(vec_path, 'r', encoding='utf-8', errors='replace') as f:
+        n, dim = (int(x) for x in f.readline().split())
+        out = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float16, shape=(n, dim))
+        words, block = [], []
+        for line in f:
+            parts = line.rstrip().split(' ')
+            if len(parts) != dim + 1:
+                continue
+            words.append(parts[0])
+            block.append([float(x) for x in parts[1:]])
+            if len(block) >= EXPORT_CHUNK_ROWS:
+                out[len(words) - len(block):len(words)] = normalize_rows(block).astype(np.float16)
+                block = []
+        if block:
+            out[len(words) - len(block):len(words)] = normalize_rows(block).astype(np.float16)
+        out.flush()
+        del out
+    if len(words) != n:
+        print(f"Warning: header says {n} words, read {len(words)}", file=sys.stderr)
+    write_vocab(vocab_path, words)
+
+
+def write_vocab(vocab_path, words):
+    with open(vocab_path, 'w', encoding='utf-8') as f:
+        for w in words:
+            f.write(w + '\n')
+
+
+def load_index(matrix_path, vocab_path):
+    with open(vocab_path, 'r', encoding='utf-8') as f:
+        words = [line.rstrip('\n') for line in f]
+    matrix = np.load(matrix_path, mmap_mode='r')
+    # the header of a half-written export may claim more rows than were filled
+    return matrix[:len(words)], words
+
+
+def load_seeds(rules_path, seeds_path):
+    seeds = defaultdict(list)
+    if rules_path:
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if '\t' not in line:
+                    continue
+                label, kws = line.split('\t', 1)
+                seeds[label].extend(kw for kw in kws.split(',') if kw)
+    if seeds_path:
+        with open(seeds_path, 'r', encoding='utf-8') as f:
+            for label, kws in json.load(f).items():
+                seeds[label].extend(kws)
+    return {label: list(dict.fromkeys(kw.lower() for kw in kws)) for label, kws in seeds.items()}
+
+
+def seed_vector(phrase, word_index, matrix, get_model):
+    """Mean of the normalized vectors of the phrase's words.
+
+    OOV words use fastText subwords; `get_model()` is only called for them and
+    returns the model (loading it on first use) or None when there is none.
+    """
+    vecs = []
+    for w in phrase.split():
+        if w in word_index:
+            vecs.append(np.asarray(matrix[word_index[w]], dtype=np.float32))
+            continue
+        model = get_model()
+        if model is not None:
+            vecs.append(normalize_rows(model.get_word_vector(w)[None, :])[0])
+    if not vecs:
+        return None
+    return normalize_rows(np.mean(vecs, axis=0)[None, :])[0]
+
+
+@profiled('search')
+def top_k_neighbours(matrix, queries, k, chunk_rows):
+    """Chunked cosine top-k: returns (scores, indices), each of shape (n_queries, k), best first."""
+    n_queries = queries.shape[0]
+    best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+    best_idx = np.zeros((n_queries, k), dtype=np.int64)
+    q_t = np.ascontiguousarray(queries.T, dtype=np.float32)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        sims = (block @ q_t).T  # (n_queries, rows)
+        kk = min(k, sims.shape[1])
+        part = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        cand_scores = np.concatenate([best_scores, np.take_along_axis(sims, part, axis=1)], axis=1)
+        cand_idx = np.concatenate([best_idx, part + start], axis=1)
+        keep = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(cand_scores, keep, axis=1)
+        best_idx = np.take_along_axis(cand_idx, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_idx, order, axis=1)
+
+
+def propose(seeds, words, scores, indices, query_labels, min_sim, per_label, min_chars):
+    all_seeds = {kw for kws in seeds.values() for kw in kws}
+    merged = defaultdict(dict)
+    for row, label in enumerate(query_labels):
+        for score, idx in zip(scores[row], indices[row]):
+            w = words[idx]
+            if score < min_sim or w in all_seeds or len(w) < min_chars or not any(c.isalpha() for c in w):
+                continue
+            if score > merged[label].get(w, -1.0):
+                merged[label][w] = float(score)
+    out = {}
+    for label, kws in seeds.items():
+        ranked = sorted(merged[label].items(), key=lambda kv: -kv[1])[:per_label]
+        out[label] = {'seeds': kws, 'proposed': {w: round(s, 4) for w, s in ranked}}
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--model', help='fastText model (.bin) to take input vectors from')
+    p.add_argument('--vec', help='alternative: text .vec file (word v1 v2 ... per line, header "n dim")')
+    p.add_argument('--index-prefix', help='where to keep the exported index (defaults to <model or vec>.index)')
+    p.add_argument('--rebuild', action='store_true', help='re-export the index even if it is up to date')
+    p.add_argument('--rules', help='rules.model file to read seed keywords from')
+    p.add_argument('--seeds', help='JSON {label: [keywords]} with seed keywords')
+    p.add_argument('--topk', type=int, default=15, help='neighbours fetched per seed keyword')
+    p.add_argument('--per-label', type=int, default=20, help='max proposals kept per label')
+    p.add_argument('--min-sim', type=float, default=0.5, help='minimum cosine similarity for a proposal')
+    p.add_argument('--min-chars', type=int, default=3)
+    p.add_argument('--chunk-rows', type=int, default=16384, help='vocabulary rows scored per matrix multiply')
+    p.add_argument('--out', help='write proposals as JSON here (default: stdout)')
+    p.add_argument('--out-rules', help='also write a rules.model with seeds + proposals merged')
+    add_profile_args(p)
+    args = p.parse_args()
+    start_profiling(args, 'expand_keywords')
+
+    source = args.model or args.vec
+    if not source:
+        print("Provide --model or --vec", file=sys.stderr)
+        sys.exit(1)
+    if args.model and fasttext is None:
+        print("fasttext python package not installed. Install with: pip install fasttext", file=sys.stderr)
+        sys.exit(2)
+    seeds = load_seeds(args.rules, args.seeds)
+    if not seeds:
+        print("No seed keywords. Provide --rules and/or --seeds", file=sys.stderr)
+        sys.exit(1)
+
+    prefix = args.index_prefix or source + '.index'
+    matrix_path, vocab_path = prefix + '.f16.npy', prefix + '.vocab.txt'
+    stale = (args.rebuild or not os.path.exists(matrix_path) or not os.path.exists(vocab_path)
+             or os.path.getmtime(matrix_path) < os.path.getmtime(source))
+    model = None
+    if stale:
+        print(f"Exporting vectors from {source} -> {matrix_path}", file=sys.stderr)
+        if args.model:
+            model = export_from_model(args.model, matrix_path, vocab_path)
+        else:
+            export_from_vec(args.vec, matrix_path, vocab_path)
+
+    def get_model():
+        # the .bin can be GBs; with a fresh index it is only needed for out-of-vocabulary seeds
+        nonlocal model
+        if model is None and args.model:
+            print(f"Loading {args.model} for out-of-vocabulary seeds", file=sys.stderr)
+            model = fasttext.load_model(args.model)
+        return model
+
+    matrix, words = load_index(matrix_path, vocab_path)
+    word_index = {w: i for i, w in enumerate(words)}
+    print(f"Index: {len(words)} words x {matrix.shape[1]} dims", file=sys.stderr)
+
+    query_labels, queries = [], []
+    for label, kws in seeds.items():
+        for kw in kws:
+            vec = seed_vector(kw, word_index, matrix, get_model)
+            if vec is None:
+                print(f"  no vector for seed '{kw}' ({label}), skipped", file=sys.stderr)
+                continue
+            query_labels.append(label)
+            queries.append(vec)
+    if not queries:
+        print("None of the seed keywords are in the model vocabulary.", file=sys.stderr)
+        sys.exit(4)
+
+    k = min(args.topk + 1, len(words))  # +1: a seed's nearest neighbour is usually itself
+    scores, indices = top_k_neighbours(matrix, np.stack(queries), k, args.chunk_rows)
+    proposals = propose(seeds, words, scores, indices, query_labels, args.min_sim, args.per_label, args.min_chars)
+
+    text = json.dumps(proposals, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Proposals written to {args.out}")
+    else:
+        print(text)
+    if args.out_rules:
+        if os.path.dirname(args.out_rules):
+            os.makedirs(os.path.dirname(args.out_rules), exist_ok=True)
+        with open(args.out_rules, 'w', encoding='utf-8') as out:
+            for label, entry in proposals.items():
+                kws = entry['seeds'] + list(entry['proposed'])
+                out.write(label + '\t' + ','.join(kws) + '\n')
+        print(f"Expanded rules written to {args.out_rules}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ Create a tiny rule model from labeled CSV or SQLite DB. Output a simple tab-sepa
 label\tkeyword1,keyword2,keyword3
 
 This file is intentionally simple so a tiny native C++ predictor can load it without heavy deps.
+`RulesModel` below mirrors that predictor (android/app/src/main/cpp/fasttext_bridge.cpp) so the
+rules can be scored offline next to a fastText model.
 """
 import argparse
 import csv
@@ -14,12 +16,51 @@ import re
 import sqlite3
 from collections import Counter, defaultdict
 
+from profiling import add_profile_args, profiled, start_profiling
+
 
 def tokenize(text):
     # simple tokenizer: lowercase, split non-word
     return [t for t in re.split(r"\W+", text.lower()) if t]
 
 
+class RulesModel:
+    """Python port of the native rules predictor: count exact keyword hits per label.
+
+    Like the bridge, a repeated label line replaces the earlier one and tokens keep
+    only ASCII letters and digits. Unlike the bridge, labels with zero hits are not
+    returned (native returns them in unordered_map order with score 0), so a text
+    without hits is scored as no prediction on purpose.
+    """
+
+    def __init__(self, path):
+        rules = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if '\t' not in line:
+                    continue
+                label, kws = line.split('\t', 1)
+                rules[label] = [kw for kw in kws.split(',') if kw]
+        self.labels = list(rules)
+        # keyword -> labels containing it, so predict is one dict lookup per token
+        self.index = defaultdict(list)
+        for label, kws in rules.items():
+            for kw in kws:
+                self.index[kw].append(label)
+
+    def predict(self, text, k=1):
+        """Return up to k (label, score) pairs with score > 0, best first."""
+        score = Counter()
+        for w in text.split():
+            # same normalization as the bridge: keep ASCII alphanumerics (std::isalnum), lowercase
+            t = ''.join(c for c in w if c.isascii() and c.isalnum()).lower()
+            for label in self.index.get(t, ()):
+                score[label] += 1
+        return score.most_common(k)
+
+
+@profiled('db_extract')
 def from_csv(csv_path, out_path, top_k=10):
     labels = defaultdict(Counter)
     with open(csv_path, newline='', encoding='utf-8') as f:
@@ -37,6 +78,7 @@ def from_csv(csv_path, out_path, top_k=10):
             out.write(label + '\t' + ','.join(top) + '\n')
 
 
+@profiled('db_extract')
 def from_db(db_path, out_path, top_k=10):
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
@@ -69,7 +111,9 @@ def main():
     p.add_argument('--db', help='Path to SQLite DB')
     p.add_argument('--out', default='models/rules.model')
     p.add_argument('--topk', type=int, default=12)
+    add_profile_args(p)
     args = p.parse_args()
+    start_profiling(args, 'export_keywords')
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
     if args.csv:
         from_csv(args.csv, args.out, top_k=args.topk)
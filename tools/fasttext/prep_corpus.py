@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+prep_corpus.py
+
+Prepare a fastText training corpus from any number of `__label__` files
+(scrape_build.py / build_unpaywall.py output, DB exports, backups/): exact-line
+dedup, an out-of-core shuffle and stratified train/valid/test splits.
+
+Usage:
+  python tools/fasttext/prep_corpus.py data/fasttext tools/fasttext/backups --out-dir data/prepared
+  python tools/fasttext/prep_corpus.py data/fasttext/train_*.txt --out-dir ./prepared --split 0.9,0.1 --max-per-label 5000
+
+How it works (two passes, RAM bounded by --memory-mb regardless of corpus size):
+ 1. scatter: every line is hashed with a seeded blake2b; the hash picks one of N
+    spill buckets on disk. Identical lines always land in the same bucket.
+ 2. gather: buckets are loaded one at a time, deduplicated by hash, shuffled and
+    streamed into the split files. Because bucket choice is uniform and
+    independent of input order, concatenating shuffled buckets is a full shuffle.
+
+Splits are stratified on the first label of each line: every line goes to the
+split that is furthest behind its target fraction for that label. With
+--max-per-label the first N lines of each label in shuffled order are kept,
+which is a uniform sample of that label.
+
+Lines that do not start with `__label__` (blank lines, stray text) are skipped.
+When walking directories, --out-dir, --tmp-dir and leftover prep_corpus_* spill
+dirs are not descended into, and state/queue/log files and anything binary are
+ignored, so re-running over a tree that contains earlier output is safe.
+"""
+import argparse
+import hashlib
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+from collections import Counter, defaultdict
+
+from profiling import add_profile_args, profiled, start_profiling
+
+LABEL_PREFIX = "__label__"
+SPLIT_NAMES = ("train", "valid", "test")
+# never corpus text: state files, work_queue.py's SQLite DB and its journals, pid/log files
+SKIP_SUFFIXES = (".json", ".db", "-wal", "-shm", "-journal", ".pid", ".log", ".pdf", ".npy")
+SNIFF_BYTES = 8192
+
+# rough in-memory size of one line vs. its bytes on disk (str object, list slot, hash set entry)
+MEMORY_OVERHEAD = 4
+# spill buffers are flushed to the bucket files once they hold this share of the memory budget
+SPILL_BUFFER_SHARE = 0.5
+
+
+def normalize_line(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def primary_label(line: str) -> str:
+    # fastText lines look like "__label__a [__label__b ...] text"; stratify on the first one
+    return line.split(" ", 1)[0][len(LABEL_PREFIX):]
+
+
+def is_text_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return b'\0' not in f.read(SNIFF_BYTES)
+    except OSError:
+        return False
+
+
+def iter_input_files(paths, skip_dirs=()):
+    skip = {os.path.realpath(d) for d in skip_dirs if d}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                # don't read our own output (or a crashed run's spill buckets) back in
+                dirs[:] = sorted(d for d in dirs if not d.startswith(('.', 'prep_corpus_'))
+                                 and os.path.realpath(os.path.join(root, d)) not in skip)
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    if (name.startswith('.') or name.endswith(SKIP_SUFFIXES) or not os.path.isfile(full)
+                            or not is_text_file(full)):
+                        continue
+                    yield full
+        elif os.path.isfile(path):
+            yield path
+        else:
+            print(f"Skipping missing input {path}", file=sys.stderr)
+
+
+def line_hash(line: str, salt: bytes) -> bytes:
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=8, key=salt).digest()
+
+
+def parse_split(spec: str):
+    parts = [float(x) for x in spec.split(',') if x.strip()]
+    if not 1 <= len(parts) <= 3 or any(x < 0 for x in parts) or sum(parts) <= 0:
+        raise argparse.ArgumentTypeError("split must be 1-3 non-negative fractions, e.g. 0.8,0.1,0.1")
+    total = sum(parts)
+    return [x / total for x in parts]
+
+
+class BucketWriter:
+    """Buffers lines per bucket and appends them to spill files when the buffer budget is hit."""
+
+    def __init__(self, tmp_dir, n_buckets, buffer_bytes):
+        self.paths = [os.path.join(tmp_dir, f"bucket_{i:05d}.txt") for i in range(n_buckets)]
+        self.buffer_bytes = buffer_bytes
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+
+    def add(self, bucket: int, line: str):
+        self.buffers[bucket].append(line)
+        self.buffered += len(line) + 1
+        if self.buffered >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self):
+        # open/close per flush so the number of buckets is not limited by the fd limit
+        for bucket, lines in self.buffers.items():
+            with open(self.paths[bucket], 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+                f.write('\n')
+        self.buffers.clear()
+        self.buffered = 0
+
+
+@profiled('scatter')
+def scatter(files, writer, n_buckets, salt, stats):
+    for path in files:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for raw in f:
+                line = normalize_line(raw)
+                if not line.startswith(LABEL_PREFIX) or ' ' not in line:
+                    stats['skipped'] += 1
+                    continue
+                stats['read'] += 1
+                h = line_hash(line, salt)
+                writer.add(int.from_bytes(h, 'little') % n_buckets, line)
+        print(f"Scattered {path}", file=sys.stderr)
+    writer.flush()
+
+
+@profiled('gather')
+def gather(bucket_paths, outs, fractions, max_per_label, rng, salt, stats):
+    assigned = defaultdict(lambda: [0] * len(fractions))
+    kept = Counter()
+    for path in bucket_paths:
+        if not os.path.exists(path):
+            continue
+        seen = set()
+        lines = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for raw in f:
+                line = raw.rstrip('\n')
+                h = line_hash(line, salt)
+                if h in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(h)
+                lines.append(line)
+        del seen
+        rng.shuffle(lines)
+        for line in lines:
+            label = primary_label(line)
+            if max_per_label and kept[label] >= max_per_label:
+                stats['capped'] += 1
+                continue
+            kept[label] += 1
+            counts = assigned[label]
+            n = sum(counts) + 1
+            # pick the split that is furthest below its target share for this label
+            split = max(range(len(fractions)), key=lambda i: fractions[i] * n - counts[i])
+            counts[split] += 1
+            outs[split].write(line + '\n')
+        os.remove(path)
+    return assigned
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('inputs', nargs='+', help='fastText files or directories containing them')
+    p.add_argument('--out-dir', required=True, help='directory for train.txt / valid.txt / test.txt')
+    p.add_argument('--split', type=parse_split, default=parse_split('0.8,0.1,0.1'),
+                   help='train,valid[,test] fractions (default 0.8,0.1,0.1)')
+    p.add_argument('--max-per-label', type=int, default=0, help='keep at most N lines per label (0 = no cap)')
+    p.add_argument('--memory-mb', type=int, default=256, help='approximate RAM budget for buffers and one bucket')
+    p.add_argument('--buckets', type=int, default=0, help='number of spill buckets (default: derived from --memory-mb)')
+    p.add_argument('--tmp-dir', default=None, help='where to put spill buckets (defaults to a temp dir in --out-dir)')
+    p.add_argument('--seed', type=int, default=42)
+    add_profile_args(p)
+    args = p.parse_args()
+    start_profiling(args, 'prep_corpus')
+
+    files = list(iter_input_files(args.inputs, skip_dirs=(args.out_dir, args.tmp_dir)))
+    if not files:
+        print("No input files found.", file=sys.stderr)
+        sys.exit(1)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    memory_bytes = args.memory_mb * 1024 * 1024
+    total_bytes = sum(os.path.getsize(f) for f in files)
+    n_buckets = args.buckets or max(1, math.ceil(total_bytes * MEMORY_OVERHEAD / memory_bytes))
+    salt = args.seed.to_bytes(8, 'little', signed=True)
+    rng = random.Random(args.seed)
+    stats = Counter()
+
+    tmp_dir = tempfile.mkdtemp(prefix='prep_corpus_', dir=args.tmp_dir or args.out_dir)
+    print(f"{len(files)} input files, {total_bytes / 1e6:.1f} MB -> {n_buckets} buckets in {tmp_dir}", file=sys.stderr)
+    try:
+        writer = BucketWriter(tmp_dir, n_buckets, int(memory_bytes * SPILL_BUFFER_SHARE / MEMORY_OVERHEAD))
+        scatter(files, writer, n_buckets, salt, stats)
+
+        names = SPLIT_NAMES[:len(args.split)]
+        out_paths = [os.path.join(args.out_dir, f"{name}.txt") for name in names]
+        outs = [open(path, 'w', encoding='utf-8') for path in out_paths]
+        try:
+            assigned = gather(writer.paths, outs, args.split, args.max_per_label, rng, salt, stats)
+        finally:
+            for out in outs:
+                out.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"Read {stats['read']} labeled lines, skipped {stats['skipped']} unlabeled, "
+          f"dropped {stats['duplicates']} duplicates and {stats['capped']} over the per-label cap.", file=sys.stderr)
+    for label in sorted(assigned):
+        parts = ', '.join(f"{name}={n}" for name, n in zip(names, assigned[label]))
+        print(f"  {label}: {parts}", file=sys.stderr)
+    for i, path in enumerate(out_paths):
+        total = sum(counts[i] for counts in assigned.values())
+        print(f"Wrote {total} lines to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+profiling.py
+
+`--profile` mode shared by the tools in tools/fasttext. When enabled, every
+pipeline stage (fetch, parse, pdf_extract, split_label, db_extract, train, ...)
+gets its own cProfile profile, allocations are traced with tracemalloc and the
+main thread is stack-sampled, and snapshots are written:
+
+ - every --profile-interval seconds (checked at stage boundaries)
+ - on SIGUSR1, so a long nohup run can be inspected without restarting it:
+     kill -USR1 $(cat tools/fasttext/scrape.pid)
+   with `run_scrape.sh N`, every worker has its own scrape.<n>.pid (and <tool>-<pid> dir):
+     for f in tools/fasttext/scrape*.pid; do kill -USR1 $(cat "$f"); done
+ - once more when the process exits
+
+Each snapshot is a directory <profile-dir>/<tool>-<pid>/<NNN>-<reason>/ with:
+ - summary.json            per-stage calls, inclusive wall/CPU seconds, net traced bytes
+ - <stage>.pstats / .txt   cProfile data (open with `python -m pstats` or snakeviz) and top functions
+ - stacks.collapsed        sampled stacks, `stage;file:func;... count` (flamegraph.pl / speedscope)
+ - alloc_top.txt           top allocation sites, and growth since the previous snapshot
+ - heap.tracemalloc        raw tracemalloc snapshot for offline comparison
+
+Profiles are cumulative since start, so consecutive snapshots can be diffed.
+Only the main process is profiled: forked children (multiprocessing workers)
+switch profiling off so they run at full speed.
+
+Usage in a tool:
+  from profiling import add_profile_args, profile_stage, profiled, start_profiling
+  ...
+  add_profile_args(p)
+  args = p.parse_args()
+  start_profiling(args, 'scrape_build')
+  with profile_stage('fetch'):
+      resp = requests.get(url)
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import signal
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+DEFAULT_INTERVAL_SECONDS = 600
+SAMPLE_SECONDS = 0.01
+TOP_ALLOCATIONS = 30
+TOP_FUNCTIONS = 40
+ROOT_STAGE = 'other'
+
+_profiler = None
+_null_stage = contextlib.nullcontext()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.alloc = 0
+
+
+class Profiler:
+    """Per-stage cProfile + tracemalloc + stack sampling; see the module docstring."""
+
+    def __init__(self, tool, out_dir, interval, clock='cpu'):
+        self.tool = tool
+        self.pid = os.getpid()
+        self.out_dir = os.path.join(out_dir, f"{tool}-{os.getpid()}")
+        self.interval = interval
+        self.clock = clock
+        self.stages = {}
+        self.stack = []
+        self.samples = Counter()
+        self.snapshots = 0
+        self.last_heap = None
+        self.last_dump = time.monotonic()
+        self.busy = False
+        self.pending = None
+        os.makedirs(self.out_dir, exist_ok=True)
+        tracemalloc.start()
+        # code outside any stage is attributed to ROOT_STAGE
+        root = self._get(ROOT_STAGE)
+        root.calls = 1
+        self.stack.append((root, time.perf_counter(), time.process_time(), 0))
+        root.profile.enable()
+
+    def _get(self, name):
+        st = self.stages.get(name)
+        if st is None:
+            st = self.stages[name] = StageStats(name)
+        return st
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        st = self._get(name)
+        if self.stack and self.stack[-1][0] is st:
+            # re-entering the active stage (e.g. a profiled helper called from the same stage)
+            yield
+            return
+        self.busy = True
+        self.stack[-1][0].profile.disable()
+        st.calls += 1
+        self.stack.append((st, time.perf_counter(), time.process_time(), tracemalloc.get_traced_memory()[0]))
+        st.profile.enable()
+        self.busy = False
+        try:
+            yield
+        finally:
+            self.busy = True
+            st.profile.disable()
+            _st, wall0, cpu0, mem0 = self.stack.pop()
+            st.wall += time.perf_counter() - wall0
+            st.cpu += time.process_time() - cpu0
+            st.alloc += tracemalloc.get_traced_memory()[0] - mem0
+            self.stack[-1][0].profile.enable()
+            self.busy = False
+            if self.pending:
+                reason, self.pending = self.pending, None
+                self.dump(reason)
+            elif self.interval and time.monotonic() - self.last_dump >= self.interval:
+                self.dump('periodic')
+
+    def current_stage(self):
+        return self.stack[-1][0].name if self.stack else ROOT_STAGE
+
+    def sample(self, signum, frame):
+        if self.busy:
+            # don't attribute the profiler's own bookkeeping and dumps to the job
+            return
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename != __file__:
+                parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(self.current_stage())
+        self.samples[';'.join(reversed(parts))] += 1
+
+    def request_dump(self, signum, frame):
+        if self.busy:
+            # between profiler swaps; dump at the next stage boundary instead
+            self.pending = 'signal'
+        else:
+            self.dump('signal')
+
+    def dump(self, reason):
+        self.busy = True
+        active = self.stack[-1][0]
+        active.profile.disable()
+        try:
+            self.snapshots += 1
+            snap_dir = os.path.join(self.out_dir, f"{self.snapshots:03d}-{reason}")
+            os.makedirs(snap_dir, exist_ok=True)
+            self._write_stages(snap_dir)
+            self._write_samples(snap_dir)
+            self._write_allocations(snap_dir)
+            print(f"[profile] snapshot written to {snap_dir}", file=sys.stderr)
+        except Exception as e:
+            print(f"[profile] snapshot failed: {e}", file=sys.stderr)
+        finally:
+            self.last_dump = time.monotonic()
+            active.profile.enable()
+            self.busy = False
+
+    def _write_stages(self, snap_dir):
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        summary = {'tool': self.tool, 'pid': os.getpid(), 'snapshot': self.snapshots,
+                   'traced_bytes': tracemalloc.get_traced_memory()[0],
+                   'traced_peak_bytes': tracemalloc.get_traced_memory()[1], 'stages': {}}
+        open_since = {entry[0].name: entry for entry in self.stack}
+        for name, st in self.stages.items():
+            wall, cpu = st.wall, st.cpu
+            if name in open_since:
+                # include the running part of stages that are still open
+                wall += now_wall - open_since[name][1]
+                cpu += now_cpu - open_since[name][2]
+            summary['stages'][name] = {'calls': st.calls, 'wall_seconds': round(wall, 4),
+                                       'cpu_seconds': round(cpu, 4), 'net_alloc_bytes': st.alloc}
+            try:
+                stats = pstats.Stats(st.profile)
+            except TypeError:
+                # no calls recorded yet
+                continue
+            stats.dump_stats(os.path.join(snap_dir, f"{name}.pstats"))
+            buf = io.StringIO()
+            pstats.Stats(st.profile, stream=buf).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            with open(os.path.join(snap_dir, f"{name}.txt"), 'w', encoding='utf-8') as f:
+                f.write(buf.getvalue())
+        with open(os.path.join(snap_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+    def _write_samples(self, snap_dir):
+        with open(os.path.join(snap_dir, 'stacks.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+    def _write_allocations(self, snap_dir):
+        # grouping by line only: filters and traceback grouping cost minutes on a multi-GB heap
+        heap = tracemalloc.take_snapshot()
+        heap.dump(os.path.join(snap_dir, 'heap.tracemalloc'))
+        with open(os.path.join(snap_dir, 'alloc_top.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Top {TOP_ALLOCATIONS} allocation sites (live memory)\n")
+            for stat in heap.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+            if self.last_heap is not None:
+                f.write(f"\nTop {TOP_ALLOCATIONS} growth since previous snapshot\n")
+                for stat in heap.compare_to(self.last_heap, 'lineno')[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+        self.last_heap = heap
+
+    def finish(self):
+        if os.getpid() != self.pid:
+            return
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_PROF if self.clock == 'cpu' else signal.ITIMER_REAL, 0)
+        self.dump('final')
+        self.stack[-1][0].profile.disable()
+        tracemalloc.stop()
+
+
+def _stop_in_child():
+    # a forked child inherits the parent's active cProfile, tracemalloc and SIGUSR1 handler; drop them.
+    # On 3.12+ cProfile hooks in through sys.monitoring, so the profile itself has to be disabled.
+    global _profiler
+    if _profiler is not None and _profiler.stack:
+        _profiler.stack[-1][0].profile.disable()
+    _profiler = None
+    sys.setprofile(None)
+    tracemalloc.stop()
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+
+def add_profile_args(parser):
+    parser.add_argument('--profile', metavar='DIR', default=None,
+                        help='profile pipeline stages and write snapshots under DIR (SIGUSR1 = snapshot now)')
+    parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL_SECONDS,
+                        help='seconds between periodic profile snapshots (0 = only on signal and exit)')
+    parser.add_argument('--profile-clock', choices=('cpu', 'wall'), default='cpu',
+                        help='stack sampling clock: cpu time, or wall time to also see time spent waiting on I/O')
+
+
+def start_profiling(args, tool):
+    """Enable profiling if --profile was given. Call once, right after parse_args()."""
+    global _profiler
+    if not getattr(args, 'profile', None) or _profiler is not None:
+        return None
+    _profiler = Profiler(tool, args.profile, args.profile_interval, clock=args.profile_clock)
+    if hasattr(signal, 'setitimer'):
+        which, signum = ((signal.ITIMER_PROF, signal.SIGPROF) if args.profile_clock == 'cpu'
+                         else (signal.ITIMER_REAL, signal.SIGALRM))
+        signal.signal(signum, _profiler.sample)
+        signal.setitimer(which, SAMPLE_SECONDS, SAMPLE_SECONDS)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, _profiler.request_dump)
+    atexit.register(_profiler.finish)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_stop_in_child)
+    print(f"[profile] writing snapshots to {_profiler.out_dir} (kill -USR1 {os.getpid()} for one now)",
+          file=sys.stderr)
+    return _profiler
+
+
+def profile_stage(name):
+    """Context manager attributing the block to stage `name`; a no-op unless --profile is on."""
+    if _profiler is None:
+        return _null_stage
+    return _profiler.stage(name)
+
+
+def profiled(name):
+    """Decorator form of profile_stage."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return fn(*args, **kwargs)
+            with _profiler.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -26,15 +26,48 @@ fi
 OUT_FILE="data/fasttext/train_financial_mgmt_html.txt"
 LOG_FILE="tools/fasttext/scrape_finlog.log"
 PID_FILE="tools/fasttext/scrape.pid"
+# optional first argument: number of parallel workers sharing a SQLite site queue
+WORKERS="${1:-1}"
+# set PROFILE_DIR=<dir> to run with --profile (then: kill -USR1 <pid> for a snapshot)
+PROFILE_ARGS=()
+if [ -n "${PROFILE_DIR:-}" ]; then
+  PROFILE_ARGS=(--profile "$PROFILE_DIR")
+fi
+QUEUE_FILE="data/fasttext/crawl_queue.db"
 
 mkdir -p $(dirname "$OUT_FILE")
 mkdir -p $(dirname "$LOG_FILE")
 
+if [ "$WORKERS" -gt 1 ]; then
+  echo "Starting $WORKERS scraper workers (background). Queue -> $QUEUE_FILE, shards -> $OUT_FILE.shard-*" | tee -a "$LOG_FILE"
+  # a new run re-crawls every site; sites finished by the previous run are put back to pending
+  if [ -f "$QUEUE_FILE" ]; then
+    .venv/bin/python tools/fasttext/work_queue.py reset --queue "$QUEUE_FILE" --done --failed | tee -a "$LOG_FILE"
+  fi
+  for i in $(seq 1 "$WORKERS"); do
+    WORKER_ID="$(hostname)-$i"
+    nohup .venv/bin/python tools/fasttext/scrape_build.py \
+      --manifest tools/fasttext/sources_manifest.json \
+      --out "$OUT_FILE" \
+      --limit-per-site 100 \
+      --queue "$QUEUE_FILE" \
+      --worker-id "$WORKER_ID" \
+      ${PROFILE_ARGS[@]+"${PROFILE_ARGS[@]}"} \
+      > "tools/fasttext/scrape_finlog.$i.log" 2>&1 &
+    echo $! > "tools/fasttext/scrape.$i.pid"
+    echo "Worker $WORKER_ID started with PID $!. Log: tools/fasttext/scrape_finlog.$i.log"
+  done
+  echo "When all workers are done: .venv/bin/python tools/fasttext/work_queue.py merge --out $OUT_FILE --append --remove-shards"
+  echo "Use 'tools/fasttext/stop_scrape.command' or 'tools/fasttext/stop_scrape.sh' to stop."
+  exit 0
+fi
+
 echo "Starting scraper (background). Output -> $OUT_FILE" | tee -a "$LOG_FILE"
 nohup .venv/bin/python tools/fasttext/scrape_build.py \
   --manifest tools/fasttext/sources_manifest.json \
   --out "$OUT_FILE" \
   --limit-per-site 100 \
+  ${PROFILE_ARGS[@]+"${PROFILE_ARGS[@]}"} \
   > "$LOG_FILE" 2>&1 &
 SCRAPE_PID=$!
 echo $SCRAPE_PID > "$PID_FILE"
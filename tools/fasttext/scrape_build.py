@@ -29,6 +29,9 @@ import requests
 from bs4 import BeautifulSoup
 import tldextract
 
+from profiling import add_profile_args, profile_stage, profiled, start_profiling
+from work_queue import DEFAULT_LEASE_SECONDS, WorkQueue, default_worker_id, shard_path
+
 # Simple label keywords map (Indonesian-focused, extend as needed)
 LABEL_KEYWORDS = {
     "zakat": ["zakat", "zalkat", "zakat fitrah", "zakat mal", "zakat profesi"],
@@ -56,6 +59,7 @@ def normalize_text(s: str) -> str:
     return s.strip()
 
 
+@profiled('parse')
 def extract_text_from_html(html: str) -> str:
     soup = BeautifulSoup(html, "lxml")
     # remove scripts/styles
@@ -108,7 +112,8 @@ def crawl_site(seed_url: str, limit: int, timeout=8, article_selector: str = Non
         if url in seen:
             continue
         try:
-            resp = requests.get(url, headers=HEADERS, timeout=timeout)
+            with profile_stage('fetch'):
+                resp = requests.get(url, headers=HEADERS, timeout=timeout)
             if resp.status_code != 200:
                 seen.add(url)
                 continue
@@ -118,30 +123,31 @@ def crawl_site(seed_url: str, limit: int, timeout=8, article_selector: str = Non
                 collected.append((url, text))
             seen.add(url)
             # find same-domain links; if article_selector is provided, only follow matching links
-            soup = BeautifulSoup(html, "lxml")
-            if article_selector:
-                # find elements matching selector and extract hrefs
-                for a in soup.select(article_selector):
-                    href = a.get('href') if getattr(a, 'get', None) else None
-                    if not href:
-                        # if the selector returned a container, try to find <a>
-                        link = a.find('a')
-                        href = link.get('href') if link is not None else None
-                    if not href:
-                        continue
-                    full = urljoin(url, href)
-                    if full.startswith('mailto:') or full.startswith('tel:'):
-                        continue
-                    if same_domain(seed_url, full) and full not in seen and len(seen) + len(to_visit) < limit*3:
-                        to_visit.append(full)
-            else:
-                for a in soup.find_all('a', href=True):
-                    href = a['href']
-                    full = urljoin(url, href)
-                    if full.startswith('mailto:') or full.startswith('tel:'):
-                        continue
-                    if same_domain(seed_url, full) and full not in seen and len(seen) + len(to_visit) < limit*3:
-                        to_visit.append(full)
+            with profile_stage('parse'):
+                soup = BeautifulSoup(html, "lxml")
+                if article_selector:
+                    # find elements matching selector and extract hrefs
+                    for a in soup.select(article_selector):
+                        href = a.get('href') if getattr(a, 'get', None) else None
+                        if not href:
+                            # if the selector returned a container, try to find <a>
+                            link = a.find('a')
+                            href = link.get('href') if link is not None else None
+                        if not href:
+                            continue
+                        full = urljoin(url, href)
+                        if full.startswith('mailto:') or full.startswith('tel:'):
+                            continue
+                        if same_domain(seed_url, full) and full not in seen and len(seen) + len(to_visit) < limit*3:
+                            to_visit.append(full)
+                else:
+                    for a in soup.find_all('a', href=True):
+                        href = a['href']
+                        full = urljoin(url, href)
+                        if full.startswith('mailto:') or full.startswith('tel:'):
+                            continue
+                        if same_domain(seed_url, full) and full not in seen and len(seen) + len(to_visit) < limit*3:
+                            to_visit.append(full)
             time.sleep(1.0)  # politeness (default, may be overridden by caller)
         except Exception as e:
             seen.add(url)
@@ -149,6 +155,84 @@ def crawl_site(seed_url: str, limit: int, timeout=8, article_selector: str = Non
     return collected[:limit]
 
 
+def process_site(entry, out, processed_urls, state_path, conf, default_limit, queue=None, worker_id=None):
+    """Crawl one manifest entry and write its labeled sentences to `out`. Returns lines written.
+
+    With a shared `queue`, pages already written by any worker are skipped, and a page
+    is recorded there only once its lines are flushed to this worker's shard.
+    """
+    url = entry.get('url')
+    if not url:
+        return 0
+    site_type = entry.get('type', 'consumer')
+    article_selector = entry.get('article_selector')
+    per_site_limit = entry.get('limit', default_limit)
+    politeness = float(entry.get('politeness_seconds', conf['politeness']))
+    exclude_keywords = conf['exclude']
+    prefer_keywords = conf['prefer']
+
+    total_written = 0
+    print(f"Crawling {url} ...", file=sys.stderr)
+    pages = crawl_site(url, limit=per_site_limit, article_selector=article_selector)
+    for page_url, text in pages:
+        # skip pages we've already processed in previous runs
+        if page_url in processed_urls:
+            continue
+        if queue is not None and queue.is_seen(page_url):
+            processed_urls.add(page_url)
+            continue
+
+        # quick skip if page looks like regulator/annual report
+        ltext = text.lower()
+        if contains_any(ltext, exclude_keywords):
+            processed_urls.add(page_url)
+            continue
+
+        with profile_stage('split_label'):
+            sentences = split_into_sentences(text)
+            random.shuffle(sentences)
+            written_for_page = 0
+            for s in sentences:
+                ls = s.lower()
+                # skip sentences containing excluded phrases
+                if contains_any(ls, exclude_keywords):
+                    continue
+                label = find_label_for_sentence(s)
+                # require a label and prefer personal keywords or site_type consumer
+                if not label:
+                    continue
+                # enforce personal-focus: if site is regulator, require prefer keyword
+                if site_type != 'consumer' and not contains_any(ls, prefer_keywords):
+                    continue
+                # if site is consumer, prefer sentences that contain personal keywords
+                if site_type == 'consumer' and not (contains_any(ls, prefer_keywords) or label):
+                    continue
+
+                line = f"__label__{label} {s.replace('\n',' ').strip()}\n"
+                out.write(line)
+                total_written += 1
+                written_for_page += 1
+                if written_for_page >= 10:
+                    break
+
+        # mark page as processed so future runs skip it
+        processed_urls.add(page_url)
+        # flush lines before recording the page, so a killed run never skips unwritten pages
+        out.flush()
+        if queue is not None:
+            queue.mark_seen(page_url, worker_id)
+
+        # persist state after each page to be safe in long runs
+        try:
+            with open(state_path, 'w', encoding='utf-8') as sf:
+                json.dump({'processed_urls': list(processed_urls)}, sf)
+        except Exception:
+            pass
+
+    sys.stderr.flush()
+    return total_written
+
+
 def main():
     p = argparse.ArgumentParser()
     p.add_argument('--manifest', required=True)
@@ -156,12 +240,20 @@ def main():
     p.add_argument('--resume', action='store_true', help='resume from previous run and append to output (uses state file)')
     p.add_argument('--state-file', default=None, help='path to state file to persist processed URLs (defaults to <out>.state.json)')
     p.add_argument('--limit-per-site', type=int, default=3)
+    p.add_argument('--queue', default=None, help='worker mode: lease sites from this shared SQLite queue and write <out>.shard-<worker-id>')
+    p.add_argument('--worker-id', default=None, help='worker name in queue mode (defaults to <hostname>-<pid>)')
+    p.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS, help='queue lease length; a dead worker\'s site is requeued after this')
+    add_profile_args(p)
     args = p.parse_args()
+    start_profiling(args, 'scrape_build')
 
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
 
+    worker_id = args.worker_id or default_worker_id()
+    out_path = shard_path(args.out, worker_id) if args.queue else args.out
+
     # state file to remember processed page URLs to allow incremental runs
-    state_path = args.state_file if args.state_file else args.out + '.state.json'
+    state_path = args.state_file if args.state_file else out_path + '.state.json'
     processed_urls = set()
     if args.resume and os.path.exists(state_path):
         try:
@@ -181,77 +273,35 @@ def main():
         global_conf = {}
         manifest = manifest_obj
 
-    EXCLUDE_KEYWORDS = [k.lower() for k in global_conf.get('exclude_if_contains', [])]
-    PREFER_KEYWORDS = [k.lower() for k in global_conf.get('prefer_keywords', [])]
-    GLOBAL_POLITENESS = float(global_conf.get('politeness_seconds', 1))
+    conf = {
+        'exclude': [k.lower() for k in global_conf.get('exclude_if_contains', [])],
+        'prefer': [k.lower() for k in global_conf.get('prefer_keywords', [])],
+        'politeness': float(global_conf.get('politeness_seconds', 1)),
+    }
 
     total_written = 0
-    out_mode = 'a' if args.resume else 'w'
-    with open(args.out, out_mode, encoding='utf-8') as out:
-        for entry in manifest:
-            url = entry.get('url')
-            if not url:
-                continue
-            site_type = entry.get('type', 'consumer')
-            article_selector = entry.get('article_selector')
-            per_site_limit = entry.get('limit', args.limit_per_site)
-            politeness = float(entry.get('politeness_seconds', GLOBAL_POLITENESS))
-
-            try:
-                print(f"Crawling {url} ...", file=sys.stderr)
-                pages = crawl_site(url, limit=per_site_limit, article_selector=article_selector)
-                for page_url, text in pages:
-                    # skip pages we've already processed in previous runs
-                    if page_url in processed_urls:
-                        continue
-
-                    # quick skip if page looks like regulator/annual report
-                    ltext = text.lower()
-                    if contains_any(ltext, EXCLUDE_KEYWORDS):
-                        processed_urls.add(page_url)
-                        continue
-
-                    sentences = split_into_sentences(text)
-                    random.shuffle(sentences)
-                    written_for_page = 0
-                    for s in sentences:
-                        ls = s.lower()
-                        # skip sentences containing excluded phrases
-                        if contains_any(ls, EXCLUDE_KEYWORDS):
-                            continue
-                        label = find_label_for_sentence(s)
-                        # require a label and prefer personal keywords or site_type consumer
-                        if not label:
-                            continue
-                        # enforce personal-focus: if site is regulator, require prefer keyword
-                        if site_type != 'consumer' and not contains_any(ls, PREFER_KEYWORDS):
-                            continue
-                        # if site is consumer, prefer sentences that contain personal keywords
-                        if site_type == 'consumer' and not (contains_any(ls, PREFER_KEYWORDS) or label):
-                            continue
-
-                        line = f"__label__{label} {s.replace('\n',' ').strip()}\n"
-                        out.write(line)
-                        total_written += 1
-                        written_for_page += 1
-                        if written_for_page >= 10:
-                            break
-
-                    # mark page as processed so future runs skip it
-                    processed_urls.add(page_url)
-
-                    # persist state after each page to be safe in long runs
-                    try:
-                        with open(state_path, 'w', encoding='utf-8') as sf:
-                            json.dump({'processed_urls': list(processed_urls)}, sf)
-                    except Exception:
-                        pass
-
-                sys.stderr.flush()
-            except Exception as e:
-                print(f"Failed crawling {url}: {e}", file=sys.stderr)
-                continue
-    print(f"Wrote {total_written} labeled lines to {args.out}")
+    # workers always append to their own shard so a restarted worker keeps what it wrote
+    out_mode = 'a' if (args.resume or args.queue) else 'w'
+    with open(out_path, out_mode, encoding='utf-8') as out:
+        if args.queue:
+            queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+            added = queue.add('site', [json.dumps(e, sort_keys=True) for e in manifest if e.get('url')])
+            print(f"[{worker_id}] queue {args.queue}: {added} new sites added", file=sys.stderr)
+
+            def handle(payload):
+                nonlocal total_written
+                total_written += process_site(json.loads(payload), out, processed_urls, state_path, conf,
+                                              args.limit_per_site, queue=queue, worker_id=worker_id)
+
+            queue.run('site', worker_id, handle)
+        else:
+            for entry in manifest:
+                try:
+                    total_written += process_site(entry, out, processed_urls, state_path, conf, args.limit_per_site)
+                except Exception as e:
+                    print(f"Failed crawling {entry.get('url')}: {e}", file=sys.stderr)
+                    continue
+    print(f"Wrote {total_written} labeled lines to {out_path}")
 
 
 if __name__ == '__main__':
@@ -1,13 +1,18 @@
 #!/bin/bash
 set -euo pipefail
-PID_FILE="$(cd "$(dirname "$0")" && pwd)/scrape.pid"
-if [ -f "$PID_FILE" ]; then
-  PID=$(cat "$PID_FILE")
-  echo "Stopping scraper PID $PID..."
-  kill "$PID" || true
-  rm -f "$PID_FILE"
+DIR="$(cd "$(dirname "$0")" && pwd)"
+# scrape.pid for a single run, scrape.<n>.pid for each worker started by run_scrape.sh <n>
+shopt -s nullglob
+PID_FILES=("$DIR"/scrape*.pid)
+if [ ${#PID_FILES[@]} -gt 0 ]; then
+  for PID_FILE in "${PID_FILES[@]}"; do
+    PID=$(cat "$PID_FILE")
+    echo "Stopping scraper PID $PID..."
+    kill "$PID" || true
+    rm -f "$PID_FILE"
+  done
   echo "Stopped."
 else
-  echo "No PID file found at $PID_FILE. Trying pkill..."
+  echo "No PID file found in $DIR. Trying pkill..."
   pkill -f scrape_build.py || echo "No running scraper found."
 fi
@@ -23,6 +23,8 @@ import sqlite3
 import sys
 import tempfile
 
+from profiling import add_profile_args, profiled, start_profiling
+
 try:
     import fasttext
 except Exception:
@@ -39,6 +41,7 @@ COMMON_SQL_QUERIES = [
 ]
 
 
+@profiled('db_extract')
 def extract_from_db(db_path, tmpfile_path, max_examples=None):
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
@@ -64,6 +67,7 @@ def extract_from_db(db_path, tmpfile_path, max_examples=None):
     return found
 
 
+@profiled('db_extract')
 def csv_to_fasttext(in_csv, tmpfile_path):
     count = 0
     with open(in_csv, newline='', encoding='utf-8') as f, open(tmpfile_path, 'w', encoding='utf-8') as out:
@@ -79,6 +83,7 @@ def csv_to_fasttext(in_csv, tmpfile_path):
     return count
 
 
+@profiled('train')
 def train(ft_train_path, out_dir, epoch=5, lr=1.0, dim=100, ws=5, minCount=1):
     if fasttext is None:
         print("fasttext python package not installed. Install with: pip install fasttext", file=sys.stderr)
@@ -110,7 +115,9 @@ def main():
     p.add_argument('--lr', type=float, default=1.0)
     p.add_argument('--dim', type=int, default=128)
     p.add_argument('--max-examples', type=int, default=0)
+    add_profile_args(p)
     args = p.parse_args()
+    start_profiling(args, 'train_fasttext')
 
     tmpfile = os.path.join(tempfile.gettempdir(), 'fasttext_train.txt')
     count = 0
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+work_queue.py
+
+SQLite-backed work queue shared by several scrape_build.py / build_unpaywall.py
+worker processes, on one machine or on several machines sharing a filesystem.
+
+Each task (a manifest site or a CrossRef query) is leased by one worker at a
+time. While a worker holds a task a heartbeat thread keeps extending the lease;
+if the worker dies the lease runs out and the next worker to ask takes it over.
+Every worker writes its own output shard (<out>.shard-<worker_id>), and the
+`merge` command combines the shards and their state files into one output.
+
+Usage:
+  python tools/fasttext/work_queue.py status --queue data/fasttext/crawl_queue.db
+  python tools/fasttext/work_queue.py merge --out data/fasttext/train_financial_mgmt_html.txt
+  python tools/fasttext/work_queue.py reset --queue data/fasttext/crawl_queue.db --failed
+  python tools/fasttext/work_queue.py reset --queue data/fasttext/crawl_queue.db --done   # before the next full crawl
+
+Workers seed the queue themselves (idempotently), so normally you only start them:
+  python tools/fasttext/scrape_build.py --manifest tools/fasttext/sources_manifest.json --out data/fasttext/train.txt --queue data/fasttext/crawl_queue.db
+  python tools/fasttext/build_unpaywall.py --queries "zakat,personal finance" --email you@example.com --out data/fasttext/train_unpaywall.txt --queue data/fasttext/unpaywall_queue.db
+
+Note: SQLite file locking is only as reliable as the shared filesystem's; local
+disks and NFSv4 with working locks are fine, SMB mounts often are not.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+SHARD_MARKER = ".shard-"
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+Task = namedtuple("Task", ["id", "kind", "payload", "attempts"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL,
+    UNIQUE (kind, payload)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (kind, status, lease_until);
+CREATE TABLE IF NOT EXISTS seen (
+    key TEXT PRIMARY KEY,
+    worker TEXT
+);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_path(out_path: str, worker_id: str) -> str:
+    return f"{out_path}{SHARD_MARKER}{worker_id}"
+
+
+class WorkQueue:
+    """Leases tasks to workers; expired leases (dead workers) are handed out again."""
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = self._connect()
+        self.conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # autocommit mode; write paths take the lock explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout=60000")
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self, conn=None):
+        conn = conn or self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add(self, kind, payloads):
+        """Enqueue payloads (strings); ones already queued, leased or done are left alone."""
+        with self._write() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO tasks (kind, payload, updated) VALUES (?, ?, ?)",
+                             [(kind, p, time.time()) for p in payloads])
+            return conn.total_changes - before
+
+    def lease(self, worker_id, kind):
+        """Take the next pending task of `kind`, or one whose lease expired. Returns None when drained."""
+        now = time.time()
+        with self._write() as conn:
+            # an expired lease counts as a failed attempt; park tasks that keep killing their worker
+            conn.execute("UPDATE tasks SET status = 'failed', lease_until = NULL, error = 'lease expired', "
+                         "updated = ? WHERE kind = ? AND status = 'leased' AND lease_until < ? AND attempts >= ?",
+                         (now, kind, now, self.max_attempts))
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM tasks WHERE kind = ? AND "
+                "(status = 'pending' OR (status = 'leased' AND lease_until < ?)) ORDER BY id LIMIT 1",
+                (kind, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, "
+                         "attempts = attempts + 1, updated = ? WHERE id = ?",
+                         (worker_id, now + self.lease_seconds, now, row[0]))
+        return Task(row[0], row[1], row[2], row[3] + 1)
+
+    def extend(self, task_id, worker_id, conn=None):
+        """Push the lease forward; returns False if another worker has taken the task over."""
+        now = time.time()
+        with self._write(conn) as c:
+            cur = c.execute("UPDATE tasks SET lease_until = ?, updated = ? "
+                            "WHERE id = ? AND worker = ? AND status = 'leased'",
+                            (now + self.lease_seconds, now, task_id, worker_id))
+            return cur.rowcount == 1
+
+    def complete(self, task_id, worker_id):
+        with self._write() as conn:
+            conn.execute("UPDATE tasks SET status = 'done', lease_until = NULL, error = NULL, updated = ? "
+                         "WHERE id = ? AND worker = ?", (time.time(), task_id, worker_id))
+
+    def fail(self, task_id, worker_id, error):
+        """Requeue the task, or park it as failed once it has used up max_attempts."""
+        with self._write() as conn:
+            conn.execute("UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                         "lease_until = NULL, error = ?, updated = ? WHERE id = ? AND worker = ?",
+                         (self.max_attempts, str(error)[:500], time.time(), task_id, worker_id))
+
+    def mark_seen(self, key, worker_id) -> bool:
+        """Claim a key (e.g. a page URL) across all workers; True only for the first claimer."""
+        with self._write() as conn:
+            cur = conn.execute("INSERT OR IGNORE INTO seen (key, worker) VALUES (?, ?)", (key, worker_id))
+            return cur.rowcount == 1
+
+    def is_seen(self, key) -> bool:
+        return self.conn.execute("SELECT 1 FROM seen WHERE key = ?", (key,)).fetchone() is not None
+
+    def reset(self, failed=False, leased=False, done=False):
+        """Put tasks back to pending. Resetting done tasks starts a new crawl, so seen keys are forgotten too."""
+        statuses = [s for s, on in (('failed', failed), ('leased', leased), ('done', done)) if on]
+        if not statuses:
+            return 0
+        with self._write() as conn:
+            cur = conn.execute(f"UPDATE tasks SET status = 'pending', lease_until = NULL, attempts = 0 "
+                               f"WHERE status IN ({','.join('?' * len(statuses))})", statuses)
+            if done:
+                conn.execute("DELETE FROM seen")
+            return cur.rowcount
+
+    def stats(self):
+        rows = self.conn.execute("SELECT kind, status, COUNT(*) FROM tasks GROUP BY kind, status").fetchall()
+        out = {}
+        for kind, status, n in rows:
+            out.setdefault(kind, {})[status] = n
+        return out
+
+    @contextlib.contextmanager
+    def keep_alive(self, task, worker_id):
+        """Extend the task's lease from a background thread for as long as the block runs."""
+        stop = threading.Event()
+
+        def beat():
+            conn = self._connect()
+            try:
+                while not stop.wait(self.lease_seconds / 3.0):
+                    try:
+                        if not self.extend(task.id, worker_id, conn):
+                            print(f"Lost lease on task {task.id}", file=sys.stderr)
+                            return
+                    except sqlite3.Error as e:
+                        print(f"Lease heartbeat failed: {e}", file=sys.stderr)
+            finally:
+                conn.close()
+
+        t = threading.Thread(target=beat, name=f"lease-{task.id}", daemon=True)
+        t.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            t.join()
+
+    def run(self, kind, worker_id, handler):
+        """Lease and handle tasks of `kind` until none are pending or leased; returns the number handled."""
+        handled = 0
+        while True:
+            task = self.lease(worker_id, kind)
+            if task is None:
+                # other workers may still die mid-task; stay around to take over their leases
+                if not self.stats().get(kind, {}).get('leased'):
+                    return handled
+                time.sleep(self.lease_seconds / 3.0)
+                continue
+            print(f"[{worker_id}] leased {kind} #{task.id} (attempt {task.attempts})", file=sys.stderr)
+            try:
+                with self.keep_alive(task, worker_id):
+                    handler(task.payload)
+            except Exception as e:
+                print(f"[{worker_id}] {kind} #{task.id} failed: {e}", file=sys.stderr)
+                self.fail(task.id, worker_id, e)
+                continue
+            self.complete(task.id, worker_id)
+            handled += 1
+
+
+def merge_states(state_paths):
+    """Union of scrape_build ({'processed_urls': [...]}) or build_unpaywall ({query: {...}}) states."""
+    merged = {}
+    for path in state_paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as sf:
+                data = json.load(sf)
+        except Exception:
+            continue
+        for key, value in data.items():
+            if key == 'processed_urls':
+                merged.setdefault(key, [])
+                merged[key] = list(dict.fromkeys(merged[key] + value))
+            elif key not in merged or value.get('written', 0) > merged[key].get('written', 0):
+                merged[key] = value
+    return merged
+
+
+def merge_shards(out_path, append=False, remove=False):
+    shards = sorted(p for p in glob.glob(glob.escape(out_path) + SHARD_MARKER + '*') if not p.endswith('.state.json'))
+    if not shards:
+        print(f"No shards found for {out_path}", file=sys.stderr)
+        return 0
+    lines = 0
+    with open(out_path, 'a' if append else 'w', encoding='utf-8') as out:
+        for shard in shards:
+            with open(shard, 'r', encoding='utf-8') as f:
+                for line in f:
+                    out.write(line)
+                    lines += 1
+            print(f"Merged {shard}", file=sys.stderr)
+    state_paths = [s + '.state.json' for s in shards]
+    if append and os.path.exists(out_path + '.state.json'):
+        state_paths.insert(0, out_path + '.state.json')
+    state = merge_states(state_paths)
+    if state:
+        with open(out_path + '.state.json', 'w', encoding='utf-8') as sf:
+            json.dump(state, sf)
+    if remove:
+        for shard in shards:
+            for path in (shard, shard + '.state.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+    return lines
+
+
+def main():
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest='cmd', required=True)
+    s = sub.add_parser('status', help='show task counts per status')
+    s.add_argument('--queue', required=True)
+    r = sub.add_parser('reset', help='put failed, leased and/or done tasks back to pending')
+    r.add_argument('--queue', required=True)
+    r.add_argument('--failed', action='store_true')
+    r.add_argument('--done', action='store_true', help='re-crawl finished tasks (also forgets seen pages)')
+    r.add_argument('--leased', action='store_true', help='only when no worker is running')
+    m = sub.add_parser('merge', help='combine <out>.shard-* files and their state into <out>')
+    m.add_argument('--out', required=True)
+    m.add_argument('--append', action='store_true', help='append to an existing <out> instead of overwriting it')
+    m.add_argument('--remove-shards', action='store_true')
+    args = p.parse_args()
+
+    if args.cmd == 'status':
+        for kind, counts in sorted(WorkQueue(args.queue).stats().items()):
+            print(kind + ': ' + ', '.join(f"{k}={v}" for k, v in sorted(counts.items())))
+    elif args.cmd == 'reset':
+        n = WorkQueue(args.queue).reset(failed=args.failed, leased=args.leased, done=args.done)
+        print(f"Reset {n} tasks to pending")
+    elif args.cmd == 'merge':
+        n = merge_shards(args.out, append=args.append, remove=args.remove_shards)
+        print(f"Wrote {n} lines to {args.out}")
+
+
+if __name__ == '__main__':
+    main()